@@ -8,11 +8,15 @@ except Exception as e:
     print("Admin seeding failed:", e)
 
 from database import Database
+from sharding import ShardedDatabase
 from auth import Authentication
+from utils import validate_coordinates
 from datetime import datetime
 import base64, os
 
-DB = Database()
+DB = ShardedDatabase.from_env() if os.environ.get('CITIFIX_SHARD_DIR') else Database()
+SHARDED = isinstance(DB, ShardedDatabase)
+ZONE_HELP = "A ward (e.g. Pune Ward 5), a configured city, a grid cell (e.g. cell_129_775) or 'default'"
 AUTH = Authentication()
 
 st.set_page_config(page_title='CitiFix', layout='wide', initial_sidebar_state='expanded')
@@ -85,6 +89,8 @@ def show_issue_detail(issue):
     st.markdown(f"## {issue['title']}")
     st.write(issue['description'])
     st.markdown(f"**Category:** {issue['category']}  •  **Status:** {issue['status']}")
+    if issue.get('ward'):
+        st.markdown(f"**Ward:** {issue['ward']}")
     st.markdown(f"**Reported at:** {issue.get('created_at')}")
     if issue.get('resolved_at'):
         resolver = DB.get_user_by_id(issue.get('resolved_by')) if issue.get('resolved_by') else None
@@ -100,7 +106,7 @@ def show_issue_detail(issue):
             name = u['username'] if u else s['authority_id']
             st.write(f"- **{name}** at {s['signed_at']} — {s.get('note','')}")
     user = st.session_state.get('user')
-    if user and user.get('role') in ('authority','admin'):
+    if user and user.get('role') in ('authority','admin') and (not SHARDED or DB.can_act_on(user['id'], issue['id'])):
         st.markdown("### Authority Actions")
         note = st.text_input("Note (optional)", key=f"note_{issue['id']}")
         col1, col2 = st.columns([1,1])
@@ -116,9 +122,30 @@ def show_issue_detail(issue):
                 st.rerun()
     st.markdown('</div>', unsafe_allow_html=True)
 
+def visible_issues(user):
+    # with sharding only admins scatter across every zone; everyone else reads one shard
+    if not SHARDED:
+        return DB.get_all_issues()
+    role = user.get('role') if user else None
+    if role == 'authority':
+        zone = DB.zone_for_user(DB.get_user_by_id(user['id']))
+        if not zone:
+            st.warning("No zone is assigned to your account yet. Ask an admin to assign one.")
+            return []
+        st.caption(f"Zone: {zone}")
+        return DB.get_issues_for_zone(zone)
+    zones = DB.get_zones()
+    options = (["All zones"] if role == 'admin' else []) + zones
+    if not options:
+        return []
+    choice = st.selectbox("Zone", options)
+    if choice == "All zones":
+        return DB.get_all_issues(zones)
+    return DB.get_issues_for_zone(choice)
+
 def page_home():
     st.title("Public Issues")
-    issues = DB.get_all_issues()
+    issues = visible_issues(st.session_state.get('user'))
     if not issues:
         st.info("No issues reported yet.")
         return
@@ -133,14 +160,25 @@ def page_report():
         description = st.text_area("Description")
         lat = st.text_input("Latitude (optional)")
         lon = st.text_input("Longitude (optional)")
+        ward = st.text_input("Ward (optional)", help="e.g. Ward 5; in multi-city deployments name the city too, e.g. Pune Ward 5")
         submitted = st.form_submit_button("Submit Issue")
         if submitted:
+            try:
+                lat_val = float(lat) if lat else None
+                lon_val = float(lon) if lon else None
+            except ValueError:
+                st.error("Latitude and longitude must be numbers.")
+                return
+            if (lat_val is None) != (lon_val is None) or (lat_val is not None and not validate_coordinates(lat_val, lon_val)):
+                st.error("Please enter both a valid latitude (-90 to 90) and longitude (-180 to 180), or neither.")
+                return
             issue = {
                 "title": title,
                 "category": category,
                 "description": description,
-                "latitude": float(lat) if lat else None,
-                "longitude": float(lon) if lon else None,
+                "latitude": lat_val,
+                "longitude": lon_val,
+                "ward": ward.strip() or None,
                 "user_id": st.session_state.get('user', {}).get('id') if st.session_state.get('user') else None
             }
             DB.create_issue(issue)
@@ -204,13 +242,40 @@ def page_admin_panel():
         email = st.text_input("Email")
         pwd = st.text_input("Password", type="password")
         phone = st.text_input("Phone (optional)")
+        zone = st.text_input("Zone", help=ZONE_HELP) if SHARDED else ''
         create = st.form_submit_button("Create Authority")
         if create:
-            uid = AUTH.create_authority(uname, email, pwd, phone)
-            if uid:
-                st.success(f"Authority user {uname} created (id: {uid})")
+            try:
+                zone = DB.normalise_zone(zone) if SHARDED and zone.strip() else None
+            except ValueError as e:
+                st.error(str(e))
             else:
-                st.error("Failed to create user (maybe username/email already exists).")
+                uid = AUTH.create_authority(uname, email, pwd, phone, zone=zone)
+                if uid:
+                    st.success(f"Authority user {uname} created (id: {uid})")
+                else:
+                    st.error("Failed to create user (maybe username/email already exists).")
+    authorities = [u for u in DB.get_all_users() if u.get('role') == 'authority']
+    if SHARDED and authorities:
+        st.subheader("Assign Authority Zone")
+        with st.form("assign_zone_form"):
+            names = {u['username']: u['id'] for u in authorities}
+            uname = st.selectbox("Authority", list(names))
+            zone = st.text_input("Zone", help=ZONE_HELP)
+            assign = st.form_submit_button("Assign Zone")
+            if assign:
+                try:
+                    DB.set_user_zone(names[uname], zone.strip() or None)
+                    st.success(f"Zone for {uname} updated.")
+                except ValueError as e:
+                    st.error(str(e))
+    if SHARDED and DB.has_legacy_issues():
+        st.subheader("Zone Shards")
+        st.info("Some issues were reported before zone sharding was enabled and are not yet visible to zone authorities.")
+        if st.button("Move existing issues into zone shards"):
+            moved = DB.migrate_legacy_issues()
+            st.success(f"Moved {moved} issues.")
+            st.rerun()
     st.markdown("---")
     st.subheader("All users")
     users = DB.get_all_users()
@@ -31,9 +31,9 @@ class Authentication:
         pwd = self.hash_password(password)
         return self.db.create_user(username, email, pwd, phone, role='citizen')
 
-    def create_authority(self, username, email, password, phone=None):
+    def create_authority(self, username, email, password, phone=None, zone=None):
         pwd = self.hash_password(password)
-        return self.db.create_user(username, email, pwd, phone, role='authority')
+        return self.db.create_user(username, email, pwd, phone, role='authority', zone=zone)
 
     def create_admin_user(self, username, email, password, phone=None):
         pwd = self.hash_password(password)
@@ -4,12 +4,22 @@ from datetime import datetime
 import threading
 import os
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def resolve_path(path):
+    # relative database paths are relative to the app, not the working directory
+    return os.path.join(BASE_DIR, path)
+
 class Database:
     def __init__(self, db_path='civic_issues.db'):
-        self.db_path = os.path.join(os.path.dirname(__file__), db_path)
+        self.db_path = resolve_path(db_path)
         self.lock = threading.Lock()
         self.init_database()
 
+    @staticmethod
+    def new_id():
+        return str(uuid.uuid4())[:8]
+
     def get_connection(self):
         conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row
@@ -19,61 +29,77 @@ class Database:
         with self.lock:
             conn = self.get_connection()
             cursor = conn.cursor()
-
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id TEXT PRIMARY KEY,
-                    username TEXT UNIQUE NOT NULL,
-                    email TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    phone TEXT,
-                    role TEXT DEFAULT 'citizen',
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS issues (
-                    id TEXT PRIMARY KEY,
-                    title TEXT NOT NULL,
-                    description TEXT NOT NULL,
-                    category TEXT NOT NULL,
-                    latitude REAL,
-                    longitude REAL,
-                    image_data TEXT,
-                    user_id TEXT,
-                    status TEXT DEFAULT 'pending',
-                    admin_notes TEXT,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    resolved_at TEXT,
-                    resolved_by TEXT
-                )
-            ''')
-
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS authority_signatures (
-                    id TEXT PRIMARY KEY,
-                    issue_id TEXT NOT NULL,
-                    authority_id TEXT NOT NULL,
-                    note TEXT,
-                    signed_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
+            self.create_user_tables(cursor)
+            self.create_issue_tables(cursor)
             conn.commit()
             conn.close()
 
+    def create_user_tables(self, cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                id TEXT PRIMARY KEY,
+                username TEXT UNIQUE NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                phone TEXT,
+                role TEXT DEFAULT 'citizen',
+                zone TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.add_missing_columns(cursor, 'users', {'zone': 'TEXT'})
+
+    def create_issue_tables(self, cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS issues (
+                id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                description TEXT NOT NULL,
+                category TEXT NOT NULL,
+                latitude REAL,
+                longitude REAL,
+                ward TEXT,
+                image_data TEXT,
+                user_id TEXT,
+                status TEXT DEFAULT 'pending',
+                admin_notes TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                resolved_at TEXT,
+                resolved_by TEXT
+            )
+        ''')
+        self.add_missing_columns(cursor, 'issues', {'ward': 'TEXT'})
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS authority_signatures (
+                id TEXT PRIMARY KEY,
+                issue_id TEXT NOT NULL,
+                authority_id TEXT NOT NULL,
+                note TEXT,
+                signed_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_signatures_issue ON authority_signatures (issue_id)')
+
+    def add_missing_columns(self, cursor, table, columns):
+        # older database files predate some columns
+        cursor.execute(f'PRAGMA table_info({table})')
+        existing = {r['name'] for r in cursor.fetchall()}
+        for name, sql_type in columns.items():
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {sql_type}')
+
     # user methods
-    def create_user(self, username, email, password_hash, phone=None, role='citizen'):
+    def create_user(self, username, email, password_hash, phone=None, role='citizen', zone=None):
         with self.lock:
             conn = self.get_connection()
             cursor = conn.cursor()
-            user_id = str(uuid.uuid4())[:8]
+            user_id = self.new_id()
             try:
                 cursor.execute('''
-                    INSERT INTO users (id, username, email, password_hash, phone, role)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (user_id, username, email, password_hash, phone, role))
+                    INSERT INTO users (id, username, email, password_hash, phone, role, zone)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (user_id, username, email, password_hash, phone, role, zone))
                 conn.commit()
                 return user_id
             except sqlite3.IntegrityError:
@@ -105,19 +131,29 @@ class Database:
         conn.close()
         return [dict(r) for r in rows]
 
+    def set_user_zone(self, user_id, zone):
+        with self.lock:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('UPDATE users SET zone = ? WHERE id = ?', (zone, user_id))
+            conn.commit()
+            updated = cursor.rowcount > 0
+            conn.close()
+            return updated
+
     # issue methods
     def create_issue(self, issue_data):
         with self.lock:
             conn = self.get_connection()
             cursor = conn.cursor()
-            issue_id = str(uuid.uuid4())[:8]
+            issue_id = issue_data.get('id') or self.new_id()
             cursor.execute('''
-                INSERT INTO issues (id, title, description, category, latitude, longitude, image_data, user_id, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO issues (id, title, description, category, latitude, longitude, ward, image_data, user_id, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 issue_id, issue_data.get('title'), issue_data.get('description'),
                 issue_data.get('category'), issue_data.get('latitude'),
-                issue_data.get('longitude'), issue_data.get('image_data'),
+                issue_data.get('longitude'), issue_data.get('ward'), issue_data.get('image_data'),
                 issue_data.get('user_id'), issue_data.get('status','pending')
             ))
             conn.commit()
@@ -0,0 +1,328 @@
+import json
+import math
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database import Database, resolve_path
+
+DEFAULT_ZONE = 'default'
+LEGACY_ZONE = 'legacy'
+RESERVED_ZONES = (DEFAULT_ZONE, LEGACY_ZONE)
+ZONE_SEPARATOR = ':'
+ZONE_PATTERN = re.compile(r'[a-z0-9_-]+')
+CELL_PATTERN = re.compile(r'cell_-?\d+_-?\d+')
+
+def slugify(value):
+    return re.sub(r'[^a-z0-9]+', '-', str(value).strip().lower()).strip('-')
+
+def zone_key(value):
+    # like slugify, but keeps underscores so cell zones survive
+    return re.sub(r'[^a-z0-9_-]+', '-', str(value).strip().lower()).strip('-')
+
+class ShardDatabase(Database):
+    """Per-zone issue store; users live only in the primary database."""
+
+    def init_database(self):
+        with self.lock:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            self.create_issue_tables(cursor)
+            conn.commit()
+            conn.close()
+
+class ShardedDatabase:
+    """Routes issues to per-zone SQLite files while users stay in the primary database.
+
+    `zone_boxes` maps each municipality to its (min_lat, min_lon, max_lat,
+    max_lon) box. An issue's zone is, in order: its ward qualified by the
+    municipality it lies in (`<box>-ward-<n>`; a plain `ward-<n>` only when
+    no boxes are configured), the containing box, a latitude/longitude grid
+    cell of `cell_size` degrees (disabled when None), or `DEFAULT_ZONE`. The
+    zone is encoded in the issue id as `<zone>:<id>`, so writes only ever
+    lock their own shard. `shard_paths` maps a zone to its own file so
+    shards can live on separate disks; any other zone gets
+    `<shard_dir>/issues_<zone>.db`. Authorities are assigned one zone.
+
+    Issues created before sharding was enabled stay readable in the primary
+    database under `LEGACY_ZONE` until `migrate_legacy_issues` moves them.
+    """
+
+    def __init__(self, db_path='civic_issues.db', shard_dir='shards', shard_paths=None,
+                 zone_boxes=None, cell_size=0.1):
+        self.primary = Database(db_path)
+        self.shard_dir = resolve_path(shard_dir)
+        self.zone_boxes = {}
+        for name, box in (zone_boxes or {}).items():
+            zone = slugify(name)
+            if not zone or zone in RESERVED_ZONES:
+                raise ValueError(f'Invalid zone box name: {name!r}')
+            self.zone_boxes[zone] = tuple(box)
+        self.shard_paths = {}
+        for name, path in (shard_paths or {}).items():
+            zone = zone_key(name)
+            if not ZONE_PATTERN.fullmatch(zone) or zone in RESERVED_ZONES:
+                raise ValueError(f'Invalid shard zone name: {name!r}')
+            self.shard_paths[zone] = resolve_path(path)
+        self.cell_size = cell_size
+        self._shards = {}
+        self._shards_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build from CITIFIX_SHARD_DIR and an optional CITIFIX_ZONE_CONFIG JSON file
+        with `zone_boxes`, `shard_paths` and `cell_size` keys."""
+        config = {}
+        config_path = os.environ.get('CITIFIX_ZONE_CONFIG')
+        if config_path:
+            with open(resolve_path(config_path)) as f:
+                config = json.load(f)
+        return cls(shard_dir=os.environ.get('CITIFIX_SHARD_DIR', 'shards'),
+                   shard_paths=config.get('shard_paths'),
+                   zone_boxes=config.get('zone_boxes'),
+                   cell_size=config.get('cell_size', 0.1))
+
+    # zone routing
+    @staticmethod
+    def _finite(lat, lon):
+        return (isinstance(lat, (int, float)) and isinstance(lon, (int, float))
+                and math.isfinite(lat) and math.isfinite(lon))
+
+    def box_for(self, lat, lon):
+        if not self._finite(lat, lon):
+            return None
+        for zone, (min_lat, min_lon, max_lat, max_lon) in self.zone_boxes.items():
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                return zone
+        return None
+
+    def zone_for_ward(self, ward, box=None):
+        """Ward zone for `ward` inside municipality `box`, or None if it can't be placed.
+
+        The municipality may also be spelled out in the ward ("Pune Ward 5").
+        """
+        slug = slugify(ward) if ward else ''
+        if slug in self.zone_boxes:
+            return slug
+        for name in sorted(self.zone_boxes, key=len, reverse=True):
+            if slug.startswith(name + '-'):
+                box, slug = name, slug[len(name) + 1:]
+                break
+        # "Ward 5" and "5" are the same ward
+        slug = re.sub(r'^ward(?:-|(?=\d))', '', slug)
+        if not slug:
+            return None
+        if self.zone_boxes:
+            return f'{box}-ward-{slug}' if box else None
+        return f'ward-{slug}'
+
+    def zone_for(self, issue_data):
+        lat, lon = issue_data.get('latitude'), issue_data.get('longitude')
+        box = self.box_for(lat, lon)
+        if issue_data.get('ward'):
+            zone = self.zone_for_ward(issue_data['ward'], box)
+            if zone:
+                return zone
+        if box:
+            return box
+        if self.cell_size and self._finite(lat, lon):
+            return f'cell_{math.floor(lat / self.cell_size)}_{math.floor(lon / self.cell_size)}'
+        return DEFAULT_ZONE
+
+    def normalise_zone(self, value):
+        """Map user input to a zone issues can be routed to; raises ValueError otherwise."""
+        key = zone_key(value or '')
+        if key == DEFAULT_ZONE or key in self.shard_paths:
+            return key
+        if self.cell_size and CELL_PATTERN.fullmatch(key):
+            return key
+        slug = slugify(key)
+        if slug in self.zone_boxes:
+            return slug
+        zone = self.zone_for_ward(key)
+        if zone:
+            return zone
+        if self.zone_boxes:
+            raise ValueError(f'Unknown zone {value!r}; wards must name their municipality, '
+                             f'one of: {", ".join(sorted(self.zone_boxes))}')
+        raise ValueError(f'Unknown zone {value!r}')
+
+    def zone_for_issue(self, issue_id):
+        zone, sep, _ = str(issue_id).rpartition(ZONE_SEPARATOR)
+        return zone if sep else LEGACY_ZONE
+
+    def zone_for_user(self, user):
+        return user.get('zone') if user else None
+
+    def get_shard(self, zone, create=True):
+        """Return the zone's shard, or None for an unknown zone when `create` is False."""
+        if zone == LEGACY_ZONE:
+            return self.primary
+        if not ZONE_PATTERN.fullmatch(zone or ''):
+            if create:
+                raise ValueError(f'Invalid zone name: {zone!r}')
+            return None
+        with self._shards_lock:
+            shard = self._shards.get(zone)
+            if shard is None:
+                path = self.shard_paths.get(zone) or os.path.join(self.shard_dir, f'issues_{zone}.db')
+                if not create and not os.path.exists(path):
+                    return None
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                shard = ShardDatabase(path)
+                self._shards[zone] = shard
+            return shard
+
+    def has_legacy_issues(self):
+        conn = self.primary.get_connection()
+        row = conn.execute('SELECT 1 FROM issues LIMIT 1').fetchone()
+        conn.close()
+        return row is not None
+
+    def get_zones(self):
+        zones = set(self.shard_paths)
+        if os.path.isdir(self.shard_dir):
+            for name in os.listdir(self.shard_dir):
+                zone = name[len('issues_'):-len('.db')]
+                if name.startswith('issues_') and name.endswith('.db') and ZONE_PATTERN.fullmatch(zone):
+                    zones.add(zone)
+        if self.has_legacy_issues():
+            zones.add(LEGACY_ZONE)
+        return sorted(zones)
+
+    def _scatter(self, fn, zones=None):
+        """Run `fn` on every existing shard in parallel; returns (zone, result) pairs."""
+        zones = self.get_zones() if zones is None else zones
+        shards = [(z, s) for z in zones for s in [self.get_shard(z, create=False)] if s]
+        if not shards:
+            return []
+        with ThreadPoolExecutor(max_workers=min(len(shards), 8)) as pool:
+            results = pool.map(lambda pair: fn(pair[1]), shards)
+            return [(z, r) for (z, _), r in zip(shards, results)]
+
+    # user methods (primary only)
+    def create_user(self, username, email, password_hash, phone=None, role='citizen', zone=None):
+        zone = self.normalise_zone(zone) if zone else None
+        return self.primary.create_user(username, email, password_hash, phone, role, zone)
+
+    def get_user_by_username(self, username):
+        return self.primary.get_user_by_username(username)
+
+    def get_user_by_id(self, user_id):
+        return self.primary.get_user_by_id(user_id)
+
+    def get_all_users(self):
+        return self.primary.get_all_users()
+
+    def set_user_zone(self, user_id, zone):
+        zone = self.normalise_zone(zone) if zone else None
+        return self.primary.set_user_zone(user_id, zone)
+
+    def can_act_on(self, authority_id, issue_id):
+        user = self.get_user_by_id(authority_id)
+        if not user:
+            return False
+        if user.get('role') == 'admin':
+            return True
+        return user.get('role') == 'authority' and self.zone_for_user(user) == self.zone_for_issue(issue_id)
+
+    # issue methods
+    def create_issue(self, issue_data):
+        zone = self.zone_for(issue_data)
+        shard = self.get_shard(zone)
+        issue_id = f'{zone}{ZONE_SEPARATOR}{Database.new_id()}'
+        return shard.create_issue(dict(issue_data, id=issue_id))
+
+    def get_issues_for_zone(self, zone):
+        shard = self.get_shard(zone, create=False)
+        return [dict(r, zone=zone) for r in shard.get_all_issues()] if shard else []
+
+    def get_all_issues(self, zones=None):
+        # scatter-gather across shards; meant for cross-zone admin views
+        issues = []
+        for zone, rows in self._scatter(lambda s: s.get_all_issues(), zones):
+            issues.extend(dict(r, zone=zone) for r in rows)
+        issues.sort(key=lambda r: r.get('created_at') or '', reverse=True)
+        return issues
+
+    def _shard_for_issue(self, issue_id):
+        return self.get_shard(self.zone_for_issue(issue_id), create=False)
+
+    def get_issue_by_id(self, issue_id):
+        shard = self._shard_for_issue(issue_id)
+        return shard.get_issue_by_id(issue_id) if shard else None
+
+    def update_issue_status(self, issue_id, status):
+        shard = self._shard_for_issue(issue_id)
+        return shard.update_issue_status(issue_id, status) if shard else False
+
+    # authority signatures and resolve flow (stored alongside the issue)
+    def add_authority_signature(self, issue_id, authority_id, note=''):
+        shard = self._shard_for_issue(issue_id)
+        if not shard or not self.can_act_on(authority_id, issue_id):
+            return None
+        return shard.add_authority_signature(issue_id, authority_id, note)
+
+    def get_signatures_for_issue(self, issue_id):
+        shard = self._shard_for_issue(issue_id)
+        return shard.get_signatures_for_issue(issue_id) if shard else []
+
+    def mark_issue_resolved(self, issue_id, authority_id, note=''):
+        shard = self._shard_for_issue(issue_id)
+        if not shard or not self.can_act_on(authority_id, issue_id):
+            return False
+        return shard.mark_issue_resolved(issue_id, authority_id, note)
+
+    # migration from a single-file deployment
+    def migrate_legacy_issues(self):
+        """Move issues (and their signatures) from the primary database into
+        their zone shards; migrated issues keep their old id as the suffix.
+
+        Each issue is read, copied and deleted inside its own write transaction
+        on the primary, so signatures or status changes made concurrently are
+        never dropped.
+        """
+        moved = 0
+        shard_conns = {}
+        with self.primary.lock:
+            conn = self.primary.get_connection()
+            try:
+                issue_ids = [r['id'] for r in conn.execute('SELECT id FROM issues').fetchall()]
+                for old_id in issue_ids:
+                    conn.execute('BEGIN IMMEDIATE')
+                    row = conn.execute('SELECT * FROM issues WHERE id = ?', (old_id,)).fetchone()
+                    if row is None:
+                        conn.rollback()
+                        continue
+                    row = dict(row)
+                    sigs = conn.execute('SELECT * FROM authority_signatures WHERE issue_id = ?', (old_id,)).fetchall()
+                    zone = self.zone_for(row)
+                    row['id'] = f'{zone}{ZONE_SEPARATOR}{old_id}'
+                    shard = self.get_shard(zone)
+                    if zone not in shard_conns:
+                        shard_conns[zone] = shard.get_connection()
+                    sconn = shard_conns[zone]
+                    with shard.lock:
+                        self._insert_row(sconn, 'issues', row)
+                        for sig in sigs:
+                            self._insert_row(sconn, 'authority_signatures', dict(sig, issue_id=row['id']))
+                        sconn.commit()
+                    # only drop the primary copy once the shard copy is committed
+                    conn.execute('DELETE FROM authority_signatures WHERE issue_id = ?', (old_id,))
+                    conn.execute('DELETE FROM issues WHERE id = ?', (old_id,))
+                    conn.commit()
+                    moved += 1
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.close()
+                for sconn in shard_conns.values():
+                    sconn.close()
+        return moved
+
+    @staticmethod
+    def _insert_row(conn, table, row):
+        cols = ', '.join(row)
+        marks = ', '.join('?' * len(row))
+        conn.execute(f'INSERT OR REPLACE INTO {table} ({cols}) VALUES ({marks})', tuple(row.values()))
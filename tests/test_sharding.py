@@ -0,0 +1,314 @@
+import os
+import sqlite3
+
+import pytest
+
+import database
+from database import Database
+from sharding import DEFAULT_ZONE, LEGACY_ZONE, ShardedDatabase
+
+
+def make_issue(title, **extra):
+    return dict({'title': title, 'description': 'desc', 'category': 'Road'}, **extra)
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    return ShardedDatabase(db_path=str(tmp_path / 'primary.db'), shard_dir=str(tmp_path / 'shards'))
+
+
+CITIES = {'Pune': [18.4, 73.7, 18.7, 74.0], 'Mumbai': [18.9, 72.7, 19.3, 73.1]}
+
+
+@pytest.fixture
+def multi_city(tmp_path):
+    return ShardedDatabase(db_path=str(tmp_path / 'primary.db'), shard_dir=str(tmp_path / 'shards'),
+                           zone_boxes=CITIES, cell_size=None)
+
+
+def set_created_at(db, zone, issue_id, created_at):
+    conn = db.get_shard(zone).get_connection()
+    conn.execute('UPDATE issues SET created_at = ? WHERE id = ?', (created_at, issue_id))
+    conn.commit()
+    conn.close()
+
+
+def table_names(path):
+    conn = sqlite3.connect(path)
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    return names
+
+
+# zone routing
+@pytest.mark.parametrize('ward', ['Ward 5', 'ward5', '5', ' WARD-5 '])
+def test_ward_routing_normalises_ward_prefix(sharded, ward):
+    assert sharded.zone_for({'ward': ward}) == 'ward-5'
+
+
+def test_ward_takes_precedence_over_coordinates(sharded):
+    assert sharded.zone_for({'ward': 'North', 'latitude': 12.97, 'longitude': 77.59}) == 'ward-north'
+
+
+def test_coordinates_route_to_grid_cell(sharded):
+    assert sharded.zone_for({'latitude': 12.97, 'longitude': 77.59}) == 'cell_129_775'
+    assert sharded.zone_for({'latitude': -0.05, 'longitude': -0.05}) == 'cell_-1_-1'
+
+
+def test_zone_boxes_route_before_grid_cells(tmp_path):
+    db = ShardedDatabase(db_path=str(tmp_path / 'primary.db'), shard_dir=str(tmp_path / 'shards'),
+                         zone_boxes={'Pune': [18.4, 73.7, 18.7, 74.0]}, cell_size=None)
+    assert db.zone_for({'latitude': 18.52, 'longitude': 73.85}) == 'pune'
+    assert db.zone_for({'ward': 'Pune'}) == 'pune'
+    assert db.zone_for({'latitude': 12.97, 'longitude': 77.59}) == DEFAULT_ZONE
+
+
+def test_wards_are_qualified_by_municipality(multi_city):
+    pune = {'latitude': 18.52, 'longitude': 73.85}
+    mumbai = {'latitude': 19.07, 'longitude': 72.87}
+    assert multi_city.zone_for(dict(pune, ward='Ward 5')) == 'pune-ward-5'
+    assert multi_city.zone_for(dict(mumbai, ward='Ward 5')) == 'mumbai-ward-5'
+    assert multi_city.zone_for({'ward': 'Pune Ward 5'}) == 'pune-ward-5'
+    # an unqualified ward with no location can't be placed in a city
+    assert multi_city.zone_for({'ward': 'Ward 5'}) == DEFAULT_ZONE
+    assert multi_city.zone_for(dict(pune, ward='')) == 'pune'
+
+
+@pytest.mark.parametrize('lat,lon', [
+    (None, None), (12.9, None), (float('nan'), 77.5), (12.9, float('inf')), (float('-inf'), float('nan')),
+])
+def test_missing_or_non_finite_coordinates_use_default_zone(sharded, lat, lon):
+    assert sharded.zone_for({'latitude': lat, 'longitude': lon}) == DEFAULT_ZONE
+    issue_id = sharded.create_issue(make_issue('x', latitude=lat, longitude=lon))
+    assert sharded.zone_for_issue(issue_id) == DEFAULT_ZONE
+
+
+def test_issue_id_encodes_zone(sharded):
+    issue_id = sharded.create_issue(make_issue('a', ward='Ward 12'))
+    assert issue_id.startswith('ward-12:')
+    assert sharded.zone_for_issue(issue_id) == 'ward-12'
+    assert sharded.zone_for_issue('abcd1234') == LEGACY_ZONE
+
+
+def test_ward_is_persisted_on_issue(sharded, tmp_path):
+    issue_id = sharded.create_issue(make_issue('a', ward='Ward 12'))
+    assert sharded.get_issue_by_id(issue_id)['ward'] == 'Ward 12'
+
+    plain = Database(str(tmp_path / 'plain.db'))
+    assert plain.get_issue_by_id(plain.create_issue(make_issue('b', ward='Ward 3')))['ward'] == 'Ward 3'
+
+
+# zone config
+@pytest.mark.parametrize('boxes,paths', [
+    ({'legacy': [0, 0, 1, 1]}, None),
+    ({'Default': [0, 0, 1, 1]}, None),
+    ({'!!!': [0, 0, 1, 1]}, None),
+    (None, {'legacy': 'x.db'}),
+    (None, {'default': 'x.db'}),
+    (None, {'???': 'x.db'}),
+])
+def test_reserved_or_invalid_zone_names_are_rejected(tmp_path, boxes, paths):
+    with pytest.raises(ValueError):
+        ShardedDatabase(db_path=str(tmp_path / 'primary.db'), shard_dir=str(tmp_path / 'shards'),
+                        zone_boxes=boxes, shard_paths=paths)
+
+
+def test_shard_paths_keys_are_normalised(tmp_path):
+    db = ShardedDatabase(db_path=str(tmp_path / 'primary.db'), shard_dir=str(tmp_path / 'shards'),
+                         shard_paths={'Ward 7': str(tmp_path / 'w7.db')})
+    issue_id = db.create_issue(make_issue('a', ward='7'))
+    assert os.path.exists(tmp_path / 'w7.db')
+    assert [i['id'] for i in db.get_all_issues()] == [issue_id]
+
+
+def test_relative_paths_share_one_base(tmp_path, monkeypatch):
+    (tmp_path / 'app').mkdir()
+    monkeypatch.setattr(database, 'BASE_DIR', str(tmp_path / 'app'))
+    monkeypatch.chdir(tmp_path)
+    db = ShardedDatabase(db_path='primary.db', shard_dir='shards', shard_paths={'ward-1': 'disk2/w1.db'})
+    db.create_issue(make_issue('a', ward='1'))
+    db.create_issue(make_issue('b', ward='2'))
+    assert os.path.exists(tmp_path / 'app' / 'primary.db')
+    assert os.path.exists(tmp_path / 'app' / 'disk2' / 'w1.db')
+    assert os.path.exists(tmp_path / 'app' / 'shards' / 'issues_ward-2.db')
+
+
+@pytest.mark.parametrize('value,zone', [
+    ('Ward 5', 'ward-5'), ('cell_129_775', 'cell_129_775'), ('Default', DEFAULT_ZONE),
+])
+def test_normalise_zone_accepts_routable_zones(sharded, value, zone):
+    assert sharded.normalise_zone(value) == zone
+
+
+@pytest.mark.parametrize('value,zone', [
+    ('Pune', 'pune'), ('Pune Ward 5', 'pune-ward-5'), ('mumbai-ward-12', 'mumbai-ward-12'),
+])
+def test_normalise_zone_accepts_configured_cities(multi_city, value, zone):
+    assert multi_city.normalise_zone(value) == zone
+
+
+@pytest.mark.parametrize('value', ['Ward 5', 'cell_129_775', 'legacy', 'Delhi'])
+def test_normalise_zone_rejects_unroutable_zones(multi_city, value):
+    with pytest.raises(ValueError):
+        multi_city.normalise_zone(value)
+    authority = multi_city.create_user('auth', 'a@example.com', 'x', role='authority')
+    with pytest.raises(ValueError):
+        multi_city.set_user_zone(authority, value)
+
+
+# shard placement
+def test_shard_paths_override_is_honoured(tmp_path):
+    custom = tmp_path / 'disk2' / 'north.db'
+    db = ShardedDatabase(db_path=str(tmp_path / 'primary.db'), shard_dir=str(tmp_path / 'shards'),
+                         shard_paths={'ward-north': str(custom)})
+    issue_id = db.create_issue(make_issue('a', ward='North'))
+    assert os.path.exists(custom)
+    assert not os.path.exists(tmp_path / 'shards' / 'issues_ward-north.db')
+    assert db.get_issue_by_id(issue_id)['title'] == 'a'
+    assert 'ward-north' in db.get_zones()
+
+
+def test_shards_hold_only_issue_tables(sharded, tmp_path):
+    sharded.create_issue(make_issue('a', ward='5'))
+    assert table_names(str(tmp_path / 'shards' / 'issues_ward-5.db')) == {'issues', 'authority_signatures'}
+    assert 'users' in table_names(str(tmp_path / 'primary.db'))
+
+
+def test_unknown_zone_lookups_do_not_create_shards(sharded, tmp_path):
+    assert sharded.get_issue_by_id('ward-99:deadbeef') is None
+    assert sharded.get_issue_by_id('../../etc:deadbeef') is None
+    assert sharded.get_issues_for_zone('ward-99') == []
+    assert not os.path.exists(tmp_path / 'shards' / 'issues_ward-99.db')
+
+
+def test_listing_ignores_bad_files_and_creates_nothing(tmp_path):
+    db = ShardedDatabase(db_path=str(tmp_path / 'primary.db'), shard_dir=str(tmp_path / 'shards'),
+                         shard_paths={'ward-empty': str(tmp_path / 'empty.db')})
+    db.create_issue(make_issue('a', ward='1'))
+    (tmp_path / 'shards' / 'issues_Bad Name.db').write_bytes(b'')
+
+    assert [i['title'] for i in db.get_all_issues()] == ['a']
+    assert 'ward-empty' in db.get_zones()
+    assert not os.path.exists(tmp_path / 'empty.db')
+
+
+# get, sign and resolve
+def test_sign_and_resolve_go_to_issue_shard(sharded):
+    authority = sharded.create_user('auth5', 'a5@example.com', 'x', role='authority', zone='Ward 5')
+    issue_id = sharded.create_issue(make_issue('pothole', ward='5'))
+    other_id = sharded.create_issue(make_issue('other', ward='6'))
+
+    assert sharded.add_authority_signature(issue_id, authority, 'on it')
+    assert sharded.mark_issue_resolved(issue_id, authority, 'done')
+
+    issue = sharded.get_shard('ward-5').get_issue_by_id(issue_id)
+    assert issue['status'] == 'resolved'
+    assert issue['resolved_by'] == authority
+    assert [s['note'] for s in sharded.get_signatures_for_issue(issue_id)] == ['on it', 'done']
+    assert sharded.get_shard('ward-6').get_signatures_for_issue(issue_id) == []
+    assert sharded.get_signatures_for_issue(other_id) == []
+
+
+def test_authority_cannot_act_outside_own_zone(sharded):
+    authority = sharded.create_user('auth5', 'a5@example.com', 'x', role='authority', zone='5')
+    unassigned = sharded.create_user('auth', 'a@example.com', 'x', role='authority')
+    admin = sharded.create_user('admin', 'ad@example.com', 'x', role='admin')
+    issue_id = sharded.create_issue(make_issue('elsewhere', ward='6'))
+
+    assert sharded.add_authority_signature(issue_id, authority) is None
+    assert sharded.mark_issue_resolved(issue_id, unassigned) is False
+    assert sharded.get_issue_by_id(issue_id)['status'] == 'pending'
+
+    sharded.set_user_zone(authority, 'Ward 6')
+    assert sharded.add_authority_signature(issue_id, authority)
+    assert sharded.mark_issue_resolved(issue_id, admin)
+
+
+def test_coordinate_only_issue_is_handled_by_its_zone_authority(sharded, multi_city):
+    issue_id = sharded.create_issue(make_issue('pothole', latitude=12.97, longitude=77.59))
+    authority = sharded.create_user('cell', 'c@example.com', 'x', role='authority',
+                                    zone=sharded.zone_for_issue(issue_id))
+    assert sharded.add_authority_signature(issue_id, authority, 'on it')
+    assert sharded.mark_issue_resolved(issue_id, authority)
+    assert sharded.get_issue_by_id(issue_id)['status'] == 'resolved'
+
+    unlocated = sharded.create_issue(make_issue('somewhere'))
+    fallback = sharded.create_user('fallback', 'f@example.com', 'x', role='authority', zone='default')
+    assert sharded.add_authority_signature(unlocated, fallback)
+
+    city_issue = multi_city.create_issue(make_issue('pothole', latitude=18.52, longitude=73.85))
+    city_authority = multi_city.create_user('pune', 'p@example.com', 'x', role='authority', zone='Pune')
+    assert multi_city.add_authority_signature(city_issue, city_authority)
+
+
+def test_same_ward_in_two_cities_has_separate_authorities(multi_city):
+    pune_issue = multi_city.create_issue(make_issue('a', ward='Ward 5', latitude=18.52, longitude=73.85))
+    mumbai_issue = multi_city.create_issue(make_issue('b', ward='Ward 5', latitude=19.07, longitude=72.87))
+    authority = multi_city.create_user('pune5', 'p5@example.com', 'x', role='authority', zone='Pune Ward 5')
+
+    assert multi_city.add_authority_signature(pune_issue, authority)
+    assert multi_city.add_authority_signature(mumbai_issue, authority) is None
+    assert [i['title'] for i in multi_city.get_issues_for_zone('pune-ward-5')] == ['a']
+
+
+# scatter-gather
+def test_get_all_issues_merges_shards_by_created_at(sharded):
+    a = sharded.create_issue(make_issue('a', ward='1'))
+    b = sharded.create_issue(make_issue('b', ward='2'))
+    c = sharded.create_issue(make_issue('c'))
+    set_created_at(sharded, 'ward-1', a, '2024-01-02 00:00:00')
+    set_created_at(sharded, 'ward-2', b, '2024-01-03 00:00:00')
+    set_created_at(sharded, DEFAULT_ZONE, c, '2024-01-01 00:00:00')
+
+    issues = sharded.get_all_issues()
+    assert [i['title'] for i in issues] == ['b', 'a', 'c']
+    assert [i['zone'] for i in issues] == ['ward-2', 'ward-1', DEFAULT_ZONE]
+    assert [i['title'] for i in sharded.get_all_issues(['ward-1', DEFAULT_ZONE])] == ['a', 'c']
+    assert [i['title'] for i in sharded.get_issues_for_zone('ward-1')] == ['a']
+
+
+# pre-existing single-file deployments
+def test_pre_existing_primary_issues_stay_visible(tmp_path):
+    primary = Database(str(tmp_path / 'primary.db'))
+    old_id = primary.create_issue(make_issue('old', latitude=12.97, longitude=77.59))
+    admin = primary.create_user('admin', 'ad@example.com', 'x', role='admin')
+
+    db = ShardedDatabase(db_path=str(tmp_path / 'primary.db'), shard_dir=str(tmp_path / 'shards'))
+    db.create_issue(make_issue('new', ward='5'))
+
+    assert LEGACY_ZONE in db.get_zones()
+    assert {i['title'] for i in db.get_all_issues()} == {'old', 'new'}
+    assert db.get_issue_by_id(old_id)['title'] == 'old'
+    assert db.add_authority_signature(old_id, admin, 'seen')
+    assert db.mark_issue_resolved(old_id, admin)
+    assert db.get_issue_by_id(old_id)['status'] == 'resolved'
+
+
+def test_migrate_legacy_issues_moves_rows_and_signatures(tmp_path):
+    primary = Database(str(tmp_path / 'primary.db'))
+    old_id = primary.create_issue(make_issue('old', latitude=12.97, longitude=77.59))
+    primary.add_authority_signature(old_id, 'someone', 'seen')
+
+    db = ShardedDatabase(db_path=str(tmp_path / 'primary.db'), shard_dir=str(tmp_path / 'shards'))
+    assert db.migrate_legacy_issues() == 1
+
+    assert not db.has_legacy_issues()
+    assert LEGACY_ZONE not in db.get_zones()
+    new_id = f'cell_129_775:{old_id}'
+    assert db.get_issue_by_id(new_id)['title'] == 'old'
+    assert [s['note'] for s in db.get_signatures_for_issue(new_id)] == ['seen']
+    assert primary.get_signatures_for_issue(old_id) == []
+
+
+def test_migrate_keeps_each_issues_own_signatures(tmp_path):
+    primary = Database(str(tmp_path / 'primary.db'))
+    first = primary.create_issue(make_issue('first', ward='1'))
+    second = primary.create_issue(make_issue('second'))
+    primary.add_authority_signature(first, 'someone', 'one')
+    primary.add_authority_signature(second, 'someone', 'two')
+
+    db = ShardedDatabase(db_path=str(tmp_path / 'primary.db'), shard_dir=str(tmp_path / 'shards'))
+    assert db.migrate_legacy_issues() == 2
+    assert [s['note'] for s in db.get_signatures_for_issue(f'ward-1:{first}')] == ['one']
+    assert [s['note'] for s in db.get_signatures_for_issue(f'{DEFAULT_ZONE}:{second}')] == ['two']
+    assert db.migrate_legacy_issues() == 0
@@ -46,6 +46,14 @@ def validate_phone(phone):
     pattern = r'^[\+]?[1-9][\d]{0,15}$'
     return re.match(pattern, phone.replace(' ', '').replace('-', '')) is not None
 
+def validate_coordinates(lat, lon):
+    """Validate latitude/longitude are finite and within range"""
+    import math
+
+    if not (math.isfinite(lat) and math.isfinite(lon)):
+        return False
+    return -90 <= lat <= 90 and -180 <= lon <= 180
+
 def sanitize_input(text):
     """Comprehensive input sanitization for HTML contexts"""
     if not text: